@@ -4,22 +4,40 @@ PyGeneralGeekDownloader - Fast asynchronous file downloader with segmented downl
 """
 
 import asyncio
+import atexit
 import logging
+import logging.handlers
+import queue
 import click
 import os
 import sys
 import time
 import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional
 from urllib.parse import urlparse
 
-# Initialize logging
+# Initialize logging. Records are pushed onto a queue and written to the
+# stream by a listener thread, so log I/O never blocks the event loop or
+# serializes concurrent downloads on the handler lock.
+_log_queue = queue.SimpleQueue()
+_log_stream_handler = logging.StreamHandler()
+_log_stream_handler.setFormatter(
+    logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+)
+_log_listener = logging.handlers.QueueListener(_log_queue, _log_stream_handler)
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
+_log_queue_handler = logging.handlers.QueueHandler(_log_queue)
 logging.basicConfig(
     level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[logging.StreamHandler()]
+    handlers=[_log_queue_handler]
 )
+# Enqueue the bare message; the listener's stream handler applies the format
+_log_queue_handler.setFormatter(logging.Formatter("%(message)s"))
 logger = logging.getLogger("pydownloader")
 
 # Import our modules
@@ -29,6 +47,57 @@ from fetch import DownloadManager, DownloadSegment
 from getsize import FileInfoManager
 from clipboard_monitor import ClipboardMonitor
 
+# Resolved once so per-download path handling avoids repeated getcwd/stat calls
+_STORE_PATH = Path(store_pth).resolve()
+
+# Shared event loop for synchronous download entry points.
+# asyncio.run() creates and tears down a fresh loop (plus resolver and
+# executor) on every call, which is wasted time when the GUI or clipboard
+# monitor fires many downloads; a single reused loop avoids that setup cost.
+_loop = None
+_loop_lock = threading.Lock()
+
+# Persistent worker pool reused for every blocking task dispatched from the
+# loop (run_in_executor), instead of ad-hoc thread creation per task
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="dl")
+atexit.register(_executor.shutdown, wait=False)
+
+def get_event_loop():
+    """Get the shared event loop, creating it (uvloop-backed if available) on first use"""
+    global _loop
+    if _loop is None or _loop.is_closed():
+        try:
+            import uvloop
+            asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+            logger.debug("Using uvloop event loop")
+        except ImportError:
+            pass
+        _loop = asyncio.new_event_loop()
+        _loop.set_default_executor(_executor)
+        asyncio.set_event_loop(_loop)
+    return _loop
+
+@lru_cache(maxsize=256)
+def load_state_file(path: str, mtime: float) -> dict:
+    """Load a .state JSON file, cached on (path, mtime) so rescans are cheap"""
+    import json
+    with open(path, 'r') as f:
+        return json.load(f)
+
+@lru_cache(maxsize=256)
+def suggest_filename(url: str) -> str:
+    """Suggest an output filename from the URL path (memoized per URL)"""
+    return os.path.basename(urlparse(url).path) or 'downloaded_file'
+
+def start_background_loop():
+    """Run the shared event loop in a daemon thread so callers can submit coroutines to it"""
+    loop = get_event_loop()
+    if not loop.is_running():
+        thread = threading.Thread(target=loop.run_forever, daemon=True, name="download-loop")
+        thread.start()
+    return loop
+
+
 class Downloader:
     """Main downloader class that orchestrates the download process"""
     
@@ -36,71 +105,171 @@ class Downloader:
         self.file_info = FileInfoManager()
         self.segment_calculator = CalcSegments()
         self.download_manager = DownloadManager()
+        # Bounded concurrency across whole files; segments within a file
+        # still run in parallel under each slot. Created lazily on first
+        # use: on Python < 3.10 lock primitives bind get_event_loop() at
+        # construction, and __init__ runs off the download loop
+        self._sem = None
+        self._sem_limit = config.get("max_concurrent_files", 3)
+
+    def _get_file_semaphore(self) -> asyncio.Semaphore:
+        """Create the whole-file slot semaphore on the loop that awaits it"""
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self._sem_limit)
+        return self._sem
+
+    def set_concurrent_files(self, limit: int):
+        """Change the whole-file slot count; takes effect on the next download
+
+        Only resets the limit and drops the current semaphore — the
+        replacement is built lazily on the download loop, never on the
+        caller's (e.g. the GUI) thread.
+        """
+        self._sem_limit = max(1, limit)
+        self._sem = None
     
-    async def download_file_async(self, url: str, output_path: Optional[str] = None, 
+    async def download_file_async(self, url: str, output_path: Optional[str] = None,
                                 segments: Optional[int] = None, show_progress: bool = True,
-                                resume: bool = True) -> str:
+                                resume: bool = True, file_size_hint: Optional[int] = None,
+                                etag_hint: Optional[str] = None,
+                                checksum: Optional[str] = None) -> str:
         """
         Download a file asynchronously using segmented downloading
-        
+
         Args:
             url: URL of the file to download
             output_path: Path to save the file (if None, determined automatically)
             segments: Number of segments to use (if None, uses config value)
             show_progress: Whether to show a progress bar
             resume: Whether to attempt to resume a previous download
-            
+            file_size_hint: Known size from a previous probe (resume state);
+                skips the HEAD request when the etag_hint still matches
+            etag_hint: ETag recorded with the size hint
+            checksum: Expected SHA-256 hex digest; the file hash is rolled
+                during the download and a mismatch fails the download
+
         Returns:
             Path to the downloaded file
         """
-        # Get file info including size and suggested filename
-        logger.info(f"Getting information for {url}")
-        file_info = await self.file_info.get_file_info_async(url, config["user_agent"])
-        file_size = file_info["size"]
-        filename = file_info["filename"]
-        
-        # Determine segments to use
-        segments_count = segments or config["segments_amount"]
-        if not file_info.get("supports_range", True):
-            logger.warning("Server doesn't support range requests, using single segment")
-            segments_count = 1
-        
-        # Calculate segments
-        segment_ranges = self.segment_calculator.get_segment(file_size, segments_count)
-        actual_segments = len(segment_ranges)
-        
-        # Determine output path
-        if output_path is None:
-            # No output path specified, use default directory with original filename
-            output_path = os.path.join(store_pth, filename)
-        elif os.path.isdir(output_path):
-            # If output_path is a directory, add the original filename to it
-            output_path = os.path.join(output_path, filename)
-        else:
-            # output_path already contains a filename, use it as is
-            # Make sure the directory exists
-            os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
-        
-        output_path = os.path.abspath(output_path)
-        
-        # Log download information
-        logger.info(f"Downloading {url} to {output_path}")
-        logger.info(f"File size: {file_size / (1024**2):.2f} MB")
-        logger.info(f"Using {actual_segments} segments")
-        
-        # Start the download
-        result = await self.download_manager.download_file_async(
-            url, output_path, segment_ranges, config["user_agent"], show_progress, resume
-        )
-        
-        logger.info(f"Download completed: {result}")
-        return result
+        sem = self._get_file_semaphore()
+        if sem.locked():
+            logger.info("Waiting for a download slot; set max_concurrent_files to 1 on slow networks")
+        async with sem:
+            # Get file info including size and suggested filename
+            logger.info("Getting information for %s", url)
+            file_info = await self.file_info.get_file_info_async(
+                url, config["user_agent"], session=self.download_manager.get_session(),
+                size_hint=file_size_hint, etag_hint=etag_hint
+            )
+            file_size = file_info["size"]
+            filename = file_info["filename"]
+        
+            # Determine output path in a single pathlib pass: default directory
+            # when unset, append the filename when given a directory, and make
+            # sure the parent exists either way
+            resolved = Path(output_path).expanduser() if output_path else _STORE_PATH / filename
+            if resolved.is_dir():
+                resolved = resolved / filename
+            resolved.parent.mkdir(parents=True, exist_ok=True)
+            output_path = str(resolved.resolve())
+
+            # No range support means one plain stream; skip segment planning
+            # entirely, since it needs a size that a no-range server may not
+            # even report (no Content-Length)
+            if not file_info.get("supports_range", True):
+                logger.warning("Server doesn't support range requests, using a single stream")
+                result = await self.download_manager.download_file_async(
+                    url, output_path, [], config["user_agent"], show_progress, resume,
+                    supports_range=False, checksum=checksum
+                )
+                logger.info("Download completed: %s", result)
+                return result
+
+            # Determine segments to use
+            segments_count = segments or config["segments_amount"]
+
+            # Calculate segments. An explicit count (user -s, or a resume
+            # replaying the layout recorded in its state) pins a fixed
+            # plan: adaptive replanning could pick a different chunk scale
+            # and produce a layout the resume validation would reject
+            chunk_feedback = None
+            if config.get("adaptive_ranges") and segments is None and segments_count > 1:
+                segment_ranges = self.segment_calculator.get_segment_adaptive(
+                    file_size, target_parallelism=segments_count
+                )
+                # Feed per-segment results back so the next adaptive plan
+                # scales its chunk from observed throughput and timeouts
+                chunk_feedback = self.segment_calculator.record_chunk_result
+            else:
+                segment_ranges = self.segment_calculator.get_segment(file_size, segments_count)
+            actual_segments = len(segment_ranges)
+
+            # Log download information; lazy %s formatting skips argument
+            # materialization entirely when INFO is filtered out
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("Downloading %s to %s", url, output_path)
+                logger.info("File size: %.2f MB", file_size / (1024**2))
+                logger.info("Using %s segments", actual_segments)
+
+            # Start the download
+            result = await self.download_manager.download_file_async(
+                url, output_path, segment_ranges, config["user_agent"], show_progress, resume,
+                etag=file_info.get("etag"),
+                checksum=checksum,
+                chunk_feedback=chunk_feedback
+            )
 
-    def download_file(self, url: str, output_path: Optional[str] = None, 
+            logger.info("Download completed: %s", result)
+            return result
+
+    async def aclose(self):
+        """Release pooled network resources held by the download manager"""
+        await self.download_manager.aclose()
+
+    def download_file(self, url: str, output_path: Optional[str] = None,
                     segments: Optional[int] = None, show_progress: bool = True,
-                    resume: bool = True) -> str:
-        """Synchronous wrapper for download_file_async"""
-        return asyncio.run(self.download_file_async(url, output_path, segments, show_progress, resume))
+                    resume: bool = True, file_size_hint: Optional[int] = None,
+                    etag_hint: Optional[str] = None,
+                    checksum: Optional[str] = None) -> str:
+        """Synchronous wrapper for download_file_async using the shared event loop"""
+        coro = self.download_file_async(url, output_path, segments, show_progress, resume,
+                                        file_size_hint, etag_hint, checksum)
+        loop = get_event_loop()
+        if loop.is_running():
+            # Loop is already running in the background thread (GUI mode):
+            # submit the coroutine to it and wait for the result
+            future = asyncio.run_coroutine_threadsafe(coro, loop)
+            return future.result()
+        with _loop_lock:
+            return loop.run_until_complete(coro)
+
+
+# Shared Downloader instance so repeated CLI commands, GUI clicks and
+# clipboard-triggered downloads reuse one connection pool instead of
+# rebuilding manager objects (and their sessions) per download
+_downloader = None
+
+def get_downloader() -> Downloader:
+    """Get the shared Downloader instance, creating it on first use"""
+    global _downloader
+    if _downloader is None:
+        _downloader = Downloader()
+    return _downloader
+
+def _close_downloader():
+    """Close the shared downloader's pooled connections on shutdown"""
+    if _downloader is None:
+        return
+    try:
+        loop = get_event_loop()
+        if loop.is_running():
+            asyncio.run_coroutine_threadsafe(_downloader.aclose(), loop).result(timeout=5)
+        else:
+            loop.run_until_complete(_downloader.aclose())
+    except Exception as e:
+        logger.debug(f"Error closing downloader: {e}")
+
+atexit.register(_close_downloader)
 
 
 @click.group()
@@ -118,10 +287,12 @@ def cli(debug):
 @click.option('--no-progress', is_flag=True, help='Disable progress bar')
 @click.option('--no-resume', is_flag=True, help='Disable resuming previous download')
 @click.option('-f', '--filename', help='Save file with this name (in default download directory if -o not specified)')
-def download(url, output, segments, no_progress, no_resume, filename):
+@click.option('-q', '--quiet', is_flag=True, help='Suppress the success message (for scripting)')
+@click.option('--checksum', help='Expected SHA-256 hex digest; verified while downloading')
+def download(url, output, segments, no_progress, no_resume, filename, quiet, checksum):
     """Download a file from URL"""
     try:
-        downloader = Downloader()
+        downloader = get_downloader()
         
         # Handle filename and output path together
         if filename and not output:
@@ -131,8 +302,10 @@ def download(url, output, segments, no_progress, no_resume, filename):
             # Otherwise, just pass output as is
             output_path = output
             
-        result = downloader.download_file(url, output_path, segments, not no_progress, not no_resume)
-        click.echo(f"Successfully downloaded to: {result}")
+        result = downloader.download_file(url, output_path, segments, not no_progress, not no_resume,
+                                          checksum=checksum)
+        if not quiet:
+            click.echo(f"Successfully downloaded to: {result}")
     except Exception as e:
         logger.error(f"Download failed: {str(e)}")
         sys.exit(1)
@@ -143,9 +316,18 @@ def download(url, output, segments, no_progress, no_resume, filename):
 def info(url):
     """Get information about a file without downloading it"""
     try:
-        file_info = FileInfoManager()
-        info_result = asyncio.run(file_info.get_file_info_async(url, config["user_agent"]))
-        
+        downloader = get_downloader()
+        loop = get_event_loop()
+
+        async def fetch_info():
+            # The pooled session must be created while the loop is running
+            session = downloader.download_manager.get_session()
+            return await downloader.file_info.get_file_info_async(
+                url, config["user_agent"], session=session
+            )
+
+        info_result = loop.run_until_complete(fetch_info())
+
         click.echo(f"File: {info_result['filename']}")
         click.echo(f"Size: {info_result['size'] / (1024**2):.2f} MB")
         click.echo(f"Type: {info_result['content_type']}")
@@ -155,6 +337,39 @@ def info(url):
         sys.exit(1)
 
 
+@cli.command()
+@click.argument('url_file', type=click.File('r'))
+def info_batch(url_file):
+    """Get information for every URL listed in a file (one per line)"""
+    urls = [line.strip() for line in url_file if line.strip()]
+    if not urls:
+        click.echo("No URLs found.")
+        return
+
+    downloader = get_downloader()
+    loop = get_event_loop()
+
+    async def gather_info():
+        session = downloader.download_manager.get_session()
+        return await asyncio.gather(
+            *(downloader.file_info.get_file_info_async(url, config["user_agent"], session=session)
+              for url in urls),
+            return_exceptions=True
+        )
+
+    results = loop.run_until_complete(gather_info())
+
+    lines = []
+    for url, info_result in zip(urls, results):
+        if isinstance(info_result, Exception):
+            lines.append(f"{url}: Error: {info_result}")
+        else:
+            size = info_result['size']
+            size_text = f"{size / (1024**2):.2f} MB" if size is not None else "unknown size"
+            lines.append(f"{url}: {info_result['filename']} ({size_text}, {info_result['content_type']})")
+    click.echo("\n".join(lines))
+
+
 @cli.command()
 def config_info():
     """Show current configuration"""
@@ -167,11 +382,10 @@ def config_info():
 def config_edit(reset):
     """Edit configuration interactively"""
     import json
-    from config import CONFIG_FILE, DEFAULT_CONFIG
-    
+    from config import CONFIG_FILE, DEFAULT_CONFIG, _atomic_write_json
+
     if reset:
-        with open(CONFIG_FILE, 'w') as f:
-            json.dump(DEFAULT_CONFIG, f, indent=4)
+        _atomic_write_json(CONFIG_FILE, DEFAULT_CONFIG)
         click.echo("Configuration reset to defaults")
         return
     
@@ -197,9 +411,10 @@ def config_edit(reset):
             if key not in new_config:
                 new_config[key] = DEFAULT_CONFIG[key]
         
-        with open(CONFIG_FILE, 'w') as f:
-            json.dump(new_config, f, indent=4)
-        
+        # Same temp-then-rename dance as config.py so an interrupted save
+        # never tears the config
+        _atomic_write_json(CONFIG_FILE, new_config)
+
         click.echo("Configuration updated")
     except Exception as e:
         logger.error(f"Failed to edit config: {str(e)}")
@@ -210,43 +425,62 @@ def config_edit(reset):
 @click.option('-p', '--path', help='Directory to search for partial downloads', default=store_pth)
 def list_downloads(path):
     """List all in-progress downloads that can be resumed"""
-    import json
-    import glob
+    from concurrent.futures import ThreadPoolExecutor
     from datetime import datetime
-    
+
+    try:
+        import orjson
+        loads = orjson.loads
+    except ImportError:
+        import json
+        loads = json.loads
+
     search_path = Path(path).expanduser() if path else Path(store_pth)
     state_files = list(search_path.glob("*.state"))
-    
+
     if not state_files:
         click.echo("No partial downloads found.")
         return
-    
-    click.echo("\nResumable downloads:")
-    click.echo("-------------------")
-    
-    for i, state_file in enumerate(state_files, 1):
+
+    # State files are independent, so parse them concurrently
+    def read_state(state_file):
         try:
-            with open(state_file, 'r') as f:
-                state = json.load(f)
-            
-            file_path = state_file.with_suffix('')
-            timestamp = datetime.fromtimestamp(state.get('timestamp', 0))
-            total_size = state.get('total_size', 0) / (1024 * 1024)  # MB
-            completed = len(state.get('completed_segments', []))
-            total = int(total_size * 1024 * 1024 / (state.get('total_size', 1) / len(state.get('completed_segments', [1]))))
-            progress = (completed / total) * 100 if total > 0 else 0
-            
-            click.echo(f"{i}. {file_path.name}")
-            click.echo(f"   URL: {state.get('uri', 'Unknown')}")
-            click.echo(f"   Size: {total_size:.2f} MB")
-            click.echo(f"   Progress: {progress:.1f}% ({completed}/{total} segments)")
-            click.echo(f"   Last updated: {timestamp}")
-            click.echo("")
+            return state_file, loads(state_file.read_bytes()), None
         except Exception as e:
-            click.echo(f"{i}. {state_file.with_suffix('').name} (Error: {str(e)})")
-    
-    click.echo("\nTo resume a download:")
-    click.echo("python app.py resume [URL]")
+            return state_file, None, e
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        results = list(pool.map(read_state, state_files))
+
+    # Collect output and emit it in one write instead of a flush per line
+    lines = ["", "Resumable downloads:", "-------------------"]
+
+    for i, (state_file, state, error) in enumerate(results, 1):
+        if state is None:
+            lines.append(f"{i}. {state_file.with_suffix('').name} (Error: {str(error)})")
+            continue
+
+        file_path = state_file.with_suffix('')
+        timestamp = datetime.fromtimestamp(state.get('timestamp', 0))
+        total_size = state.get('total_size', 0) / (1024 * 1024)  # MB
+        # Count what resume would actually see: completions logged since
+        # the last compaction live in the WAL, not the compacted state
+        completed_ids = set(state.get('completed_segments', []))
+        DownloadManager._replay_segment_log(state_file, completed_ids)
+        completed = len(completed_ids)
+        total = state.get('total_segments') or completed
+        progress = (completed / total) * 100 if total > 0 else 0
+
+        lines.append(f"{i}. {file_path.name}")
+        lines.append(f"   URL: {state.get('uri', 'Unknown')}")
+        lines.append(f"   Size: {total_size:.2f} MB")
+        lines.append(f"   Progress: {progress:.1f}% ({completed}/{total} segments)")
+        lines.append(f"   Last updated: {timestamp}")
+        lines.append("")
+
+    lines.append("\nTo resume a download:")
+    lines.append("python app.py resume [URL]")
+    click.echo("\n".join(lines))
 
 
 @cli.command()
@@ -258,7 +492,7 @@ def resume(url, output, no_progress):
     import glob
     import json
     
-    downloader = Downloader()
+    downloader = get_downloader()
     
     # If URL is provided, try to find a matching state file
     if url:
@@ -269,32 +503,54 @@ def resume(url, output, no_progress):
                 if not state_file.suffix == '.state':
                     state_file = Path(f"{url}.state")
             else:
-                # Try to find a state file with matching URL
-                state_files = list(Path(store_pth).glob("*.state"))
+                import hashlib
+
+                # Direct lookup via the sidecar index maintained by DownloadManager
                 state_file = None
-                
-                for sf in state_files:
+                index_file = Path(store_pth) / "index.json"
+                if index_file.exists():
                     try:
-                        with open(sf, 'r') as f:
-                            state = json.load(f)
-                        if state.get('uri') == url:
-                            state_file = sf
-                            break
-                    except:
-                        continue
+                        with open(index_file, 'r') as f:
+                            index = json.load(f)
+                        name = index.get(hashlib.sha1(url.encode()).hexdigest())
+                        if name and (Path(store_pth) / name).exists():
+                            state_file = Path(store_pth) / name
+                    except Exception as e:
+                        logger.debug(f"Error reading state index: {e}")
+
+                if state_file is None:
+                    # Fall back to scanning legacy state files without an index entry
+                    state_files = list(Path(store_pth).glob("*.state"))
+
+                    for sf in state_files:
+                        try:
+                            state = load_state_file(str(sf), sf.stat().st_mtime)
+                            if state.get('uri') == url:
+                                state_file = sf
+                                break
+                        except (OSError, ValueError):
+                            # Unreadable or corrupt state file; keep scanning
+                            continue
             
             if state_file and state_file.exists():
                 with open(state_file, 'r') as f:
                     state = json.load(f)
                 
                 file_path = state_file.with_suffix('')
+                # Rebuild the plan with the segment count recorded in the
+                # state: a replanned layout (config default or a different
+                # adaptive chunk) would fail the resume validation and
+                # restart from scratch
+                resume_segments = state.get('total_segments')
                 if output:
                     result = downloader.download_file(
-                        state.get('uri'), output, None, not no_progress, True
+                        state.get('uri'), output, resume_segments, not no_progress, True,
+                        file_size_hint=state.get('total_size'), etag_hint=state.get('etag')
                     )
                 else:
                     result = downloader.download_file(
-                        state.get('uri'), str(file_path), None, not no_progress, True
+                        state.get('uri'), str(file_path), resume_segments, not no_progress, True,
+                        file_size_hint=state.get('total_size'), etag_hint=state.get('etag')
                     )
                 
                 click.echo(f"Successfully resumed download to: {result}")
@@ -317,9 +573,14 @@ def resume(url, output, no_progress):
 def monitor():
     """Start clipboard monitoring for URLs to download"""
     try:
-        downloader = Downloader()
+        downloader = get_downloader()
+        # Run the shared event loop in the background (as the GUI does) so
+        # clipboard-pool threads submit downloads via run_coroutine_threadsafe
+        # instead of serializing behind the loop lock — otherwise the
+        # max_concurrent_files semaphore never gets to arbitrate anything
+        start_background_loop()
         monitor = ClipboardMonitor(downloader)
-        
+
         click.echo("Starting clipboard monitor. Press Ctrl+C to stop.")
         monitor.start_monitoring()
         
@@ -352,13 +613,16 @@ def start_gui(monitor=True):
         root.title("PyGeneralGeekDownloader")
         root.geometry("600x400")
         
-        # Initialize downloader
-        downloader = Downloader()
-        
-        # Initialize clipboard monitor if requested
-        clipboard_mon = None
+        # Initialize downloader and run the shared event loop in the background
+        # so downloads are asyncio tasks instead of one thread per click
+        downloader = get_downloader()
+        loop = start_background_loop()
+
+        # Construct the clipboard monitor once; toggling just flips its gate.
+        # Prompts are built on this root via after() rather than a Tk() each
+        clipboard_mon = ClipboardMonitor(downloader)
+        clipboard_mon.attach_root(root)
         if monitor:
-            clipboard_mon = ClipboardMonitor(downloader)
             clipboard_mon.start_monitoring()
             logger.info("Clipboard monitoring started")
         
@@ -385,23 +649,26 @@ def start_gui(monitor=True):
                 # Just use the output_dir as is
                 output_path = output_dir if output_dir else None
             
-            # Start download in a separate thread
-            def download_thread():
+            # Submit the download to the shared loop; the GUI thread never blocks
+            status_label.config(text="Downloading...")
+            future = asyncio.run_coroutine_threadsafe(
+                downloader.download_file_async(
+                    url=url,
+                    output_path=output_path,
+                    segments=segments if segments > 0 else None,
+                    show_progress=show_progress
+                ),
+                loop
+            )
+
+            def on_download_done(fut):
                 try:
-                    status_label.config(text="Downloading...")
-                    result = downloader.download_file(
-                        url=url, 
-                        output_path=output_path,
-                        segments=segments if segments > 0 else None,
-                        show_progress=show_progress
-                    )
-                    status_label.config(text=f"Downloaded to: {result}")
+                    result = fut.result()
+                    root.after(0, lambda: status_label.config(text=f"Downloaded to: {result}"))
                 except Exception as e:
-                    status_label.config(text=f"Error: {str(e)}")
-            
-            thread = threading.Thread(target=download_thread)
-            thread.daemon = True
-            thread.start()
+                    root.after(0, lambda e=e: status_label.config(text=f"Error: {str(e)}"))
+
+            future.add_done_callback(on_download_done)
             
         def browse_output_dir():
             directory = filedialog.askdirectory()
@@ -409,23 +676,18 @@ def start_gui(monitor=True):
                 output_path_var.set(directory)
                 
         def toggle_monitor():
-            nonlocal clipboard_mon
-            
-            if clipboard_mon and clipboard_mon.monitoring:
+            if clipboard_mon.monitoring:
                 clipboard_mon.stop_monitoring()
                 monitor_button.config(text="Start Monitor")
                 logger.info("Clipboard monitoring stopped")
             else:
-                if not clipboard_mon:
-                    clipboard_mon = ClipboardMonitor(downloader)
                 clipboard_mon.start_monitoring()
                 monitor_button.config(text="Stop Monitor")
                 logger.info("Clipboard monitoring started")
-        
+
         # On window close
         def on_closing():
-            if clipboard_mon:
-                clipboard_mon.stop_monitoring()
+            clipboard_mon.stop_monitoring()
             root.destroy()
             
         root.protocol("WM_DELETE_WINDOW", on_closing)
@@ -456,11 +718,7 @@ def start_gui(monitor=True):
             try:
                 url = url_entry.get()
                 if url:
-                    from urllib.parse import urlparse
-                    parsed_url = urlparse(url)
-                    path_parts = parsed_url.path.split('/')
-                    if path_parts and path_parts[-1]:
-                        filename_var.set(path_parts[-1])
+                    filename_var.set(suggest_filename(url))
             except Exception as e:
                 logger.debug(f"Error auto-detecting filename: {e}")
         
@@ -499,6 +757,28 @@ def start_gui(monitor=True):
         )
         segments_spinbox.pack(side=tk.LEFT, padx=5)
         
+        # Concurrent files
+        concurrent_frame = ttk.Frame(options_frame)
+        concurrent_frame.pack(fill=tk.X, pady=5)
+
+        ttk.Label(concurrent_frame, text="Concurrent files:").pack(side=tk.LEFT, padx=5)
+        concurrent_var = tk.IntVar(value=config.get("max_concurrent_files", 3))
+
+        def update_concurrent_files():
+            # Only records the limit; the semaphore itself is rebuilt
+            # lazily on the download loop, not on this Tk thread
+            downloader.set_concurrent_files(concurrent_var.get())
+
+        concurrent_spinbox = ttk.Spinbox(
+            concurrent_frame,
+            from_=1,
+            to=16,
+            textvariable=concurrent_var,
+            width=5,
+            command=update_concurrent_files
+        )
+        concurrent_spinbox.pack(side=tk.LEFT, padx=5)
+
         # Progress bar option
         progress_var = tk.BooleanVar(value=True)
         progress_check = ttk.Checkbutton(
@@ -521,7 +801,7 @@ def start_gui(monitor=True):
         
         monitor_button = ttk.Button(
             button_frame, 
-            text="Stop Monitor" if (monitor and clipboard_mon) else "Start Monitor", 
+            text="Stop Monitor" if clipboard_mon.monitoring else "Start Monitor",
             command=toggle_monitor
         )
         monitor_button.pack(side=tk.LEFT, padx=5)
@@ -542,14 +822,13 @@ def start_gui(monitor=True):
 def legacy_main():
     """Legacy command-line interface for backward compatibility"""
     try:
-        downloader = Downloader()
+        downloader = get_downloader()
         
         # Get URL from user
         url = input('Download link (eg. https://....): ')
         
         # Suggest filename from URL
-        parsed_url = urlparse(url)
-        suggested_name = os.path.basename(parsed_url.path) or 'downloaded_file'
+        suggested_name = suggest_filename(url)
         filename = input(f'Download as (filename) [{suggested_name}]: ') or suggested_name
         
         # Ask about resuming
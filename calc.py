@@ -1,12 +1,44 @@
 from typing import List, Tuple
 import logging
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+if np is not None and numba is not None:
+    @numba.njit(cache=True)
+    def _calc_ranges(max_size, segments_amount):
+        """Fill the [start, end] range table in a compiled loop"""
+        base = max_size // segments_amount
+        rem = max_size % segments_amount
+        ranges = np.empty((segments_amount, 2), np.int64)
+        start = 0
+        for i in range(segments_amount):
+            size = base + 1 if i < rem else base
+            ranges[i, 0] = start
+            ranges[i, 1] = start + size - 1
+            start += size
+        return ranges
+else:
+    _calc_ranges = None
+
 class CalcSegments:
     """Class for calculating download segments for parallel downloading"""
     
     def __init__(self):
         self.logger = logging.getLogger(__name__)
-    
+        # Multiplier learned from chunk feedback. Only the scale carries
+        # over between files — the base chunk is always derived from the
+        # file being planned, so one file's history can't dictate another
+        # file's layout
+        self._adaptive_scale = 1.0
+
     def get_segment(self, max_size: int, segments_amount: int) -> List[List[int]]:
         """
         Calculate download segments based on file size and desired segment count
@@ -14,32 +46,109 @@ class CalcSegments:
         Args:
             max_size: Total size of the file in bytes
             segments_amount: Number of segments to divide the download into
-            
+
         Returns:
-            List of segment ranges as [start, end] pairs
-            
+            Segment ranges as [start, end] pairs: an int64 ndarray of shape
+            (n, 2) when numpy is available, else a list of two-element lists
+
         Raises:
             ValueError: If file size is invalid or server forbids access
         """
-        self.logger.info(f"Calculating segments for {max_size} bytes file into {segments_amount} parts")
-        
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("Calculating segments for %s bytes file into %s parts", max_size, segments_amount)
+
         if max_size <= 0:
             raise ValueError('Invalid file size. This link may be expired or forbidden by the remote server.')
-            
+
         # Adjust segment amount if file is too small
         actual_segments = min(segments_amount, max_size)
         if actual_segments < segments_amount:
             self.logger.warning(f"File too small for {segments_amount} segments, using {actual_segments} instead")
             segments_amount = actual_segments
-            
-        # Calculate segment size and create segment ranges
-        standard_size = max_size // segments_amount
-        l1_segments = list(range(0, max_size, standard_size))
-        
-        # Create segments as [start, end] pairs
-        segments = [[x, x + standard_size - 1] for x in l1_segments]
-        
-        # Ensure the last segment reaches the end of file
-        segments[-1][-1] = max_size - 1
-        
+
+        if _calc_ranges is not None:
+            # JIT-compiled path: the whole table is built without interpreter overhead
+            return _calc_ranges(max_size, segments_amount)
+
+        # Spread the remainder over the first segments so exactly
+        # segments_amount ranges come out and none degenerates into a
+        # tiny tail that pays full request overhead for a few bytes
+        base, rem = divmod(max_size, segments_amount)
+
+        if np is not None:
+            # Build the [start, end] table in a single vectorized pass
+            sizes = np.full(segments_amount, base, dtype=np.int64)
+            sizes[:rem] += 1
+            starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+            ends = starts + sizes - 1
+            return np.stack([starts, ends], axis=1)
+
+        # Pure-Python fallback when numpy is not installed
+        segments = []
+        start = 0
+        for i in range(segments_amount):
+            size = base + 1 if i < rem else base
+            segments.append([start, start + size - 1])
+            start += size
+
         return segments
+
+    def get_segment_adaptive(self, max_size: int, min_chunk: int = 4 * 1024 * 1024,
+                             max_chunk: int = 64 * 1024 * 1024,
+                             target_parallelism: int = 8) -> List[List[int]]:
+        """
+        Calculate download segments sized by chunk rather than by fixed count
+
+        Instead of cutting the file into a hard number of equal pieces, pick a
+        chunk size matched to the file: roughly max_size / target_parallelism,
+        clamped between min_chunk and max_chunk. Large files get more ranges
+        (better parallelism), small files get fewer (fewer wasted round trips).
+        Feedback from completed chunks (see record_chunk_result) nudges the
+        chunk size up when throughput is sustained and down on timeouts.
+
+        Args:
+            max_size: Total size of the file in bytes
+            min_chunk: Smallest allowed chunk size in bytes
+            max_chunk: Largest allowed chunk size in bytes
+            target_parallelism: Desired number of in-flight ranges
+
+        Returns:
+            Segment ranges as [start, end] pairs (same shape as get_segment)
+
+        Raises:
+            ValueError: If file size is invalid or server forbids access
+        """
+        if max_size <= 0:
+            raise ValueError('Invalid file size. This link may be expired or forbidden by the remote server.')
+
+        # Base chunk from this file's own size; feedback only scales it,
+        # clamped so a bad streak can't pin the plan against the rails
+        chunk = max(min_chunk, min(max_chunk, max_size // target_parallelism))
+        chunk = int(chunk * self._adaptive_scale)
+        chunk = max(min_chunk, min(max_chunk, chunk))
+        chunk = min(chunk, max_size)
+
+        segments_amount = (max_size + chunk - 1) // chunk
+        self.logger.debug("Adaptive plan: %s chunks of %s bytes", segments_amount, chunk)
+        return self.get_segment(max_size, segments_amount)
+
+    def record_chunk_result(self, chunk_bytes: int, elapsed: float, timed_out: bool = False):
+        """
+        Feedback hook for adaptive segmentation
+
+        Called after a chunk finishes (or times out) so the next plan can use
+        a better chunk size: halve the scale when the transfer timed out,
+        grow it when the chunk completed quickly enough that per-range
+        overhead dominates. The scale is a bounded multiplier on the
+        per-file base chunk, not an absolute size.
+
+        Args:
+            chunk_bytes: Size of the completed chunk in bytes
+            elapsed: Wall time the chunk took in seconds
+            timed_out: Whether the chunk hit a timeout
+        """
+        if timed_out:
+            self._adaptive_scale = max(self._adaptive_scale / 2, 0.25)
+        elif elapsed > 0 and elapsed < 2.0:
+            # Chunk finished fast: spend less time on per-range round trips
+            self._adaptive_scale = min(self._adaptive_scale * 2, 4.0)
@@ -1,15 +1,46 @@
 import re
+import sys
+import queue
 import threading
 import time
-import tkinter as tk
-from tkinter import messagebox
-import pyperclip
-from urllib.parse import urlparse
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 import logging
+from config import config
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+try:
+    # Optional linear-time regex engine; the pattern below is already free
+    # of alternation but re2 guarantees no backtracking on any input
+    import re2
+except ImportError:
+    re2 = None
 
 # Logger setup
 logger = logging.getLogger("clipboard_monitor")
 
+# Hot-loop constants live at module scope so the 2 Hz poll path does a
+# single global load instead of an instance-dict lookup per tick.
+# Character classes and bounded quantifiers only — no alternation to
+# backtrack over; length caps match DNS (253) and sane path limits
+_URL_RE = (re2 or re).compile(
+    r"""\bhttps?://[\w\-.%]{1,253}(?:/[^\s<>"'`]{0,2048})?"""
+)
+_SCHEMES = ("http://", "https://")
+_MAX_URL_SCAN = 4096
+
+# Immutable answer captured by the prompt dialog's OK handler
+PromptResult = namedtuple("PromptResult", "ok url filename login password")
+
+# How long a URL that was already prompted for stays suppressed, and how
+# many such URLs are remembered at most
+_PROMPT_SUPPRESS_S = 30
+_RECENT_URLS_MAX = 16
+
 class ClipboardMonitor:
     """Monitor clipboard for URLs and prompt user to download them"""
     
@@ -21,37 +52,141 @@ class ClipboardMonitor:
             downloader: Instance of the Downloader class
         """
         self.downloader = downloader
-        self.monitoring = False
+        # Threads are created once and gated on this event, so toggling
+        # monitoring on and off never tears down or recreates them
+        self._active = threading.Event()
+        # Set to break watcher threads out of their interval waits at once
+        # instead of letting them finish a sleep after a stop request
+        self._wake = threading.Event()
+        self._running = True
         self.monitor_thread = None
+        self.consumer_thread = None
         self.last_clipboard_content = ""
-        self.url_pattern = re.compile(
-            r'https?://(?:[-\w.]|(?:%[\da-fA-F]{2}))+[/\w\.-]*\??[/\w\.-=&%]*'
+        # Fingerprint of the last payload; comparing two 64-bit ints per
+        # tick replaces a full string compare of arbitrarily large content
+        self._last_hash = self._fingerprint("")
+        # Detected URLs flow through this queue from the watcher (edge-triggered
+        # on Windows, polling elsewhere) to the consumer that prompts/downloads
+        self._url_queue = queue.Queue()
+        self._listener_hwnd = None
+        # When a GUI root is attached, prompts are posted here and built on
+        # the Tk main thread instead of spinning up a Tk() per URL
+        self._root = None
+        self._prompt_queue = queue.Queue()
+        # Bounded worker pool for accepted downloads; a paste flood queues
+        # work here instead of spawning a thread per URL
+        self._pool = ThreadPoolExecutor(
+            max_workers=config.get("max_concurrent_downloads", 4),
+            thread_name_prefix="clip-dl"
         )
-        
+        # On macOS the pasteboard changeCount is a microsecond read, while
+        # pyperclip.paste() is an AppleScript round trip; use it as a gate
+        self._pb = self._try_import_pb()
+        self._last_change_count = -1
+        # Windows counterpart: the clipboard sequence number can be read
+        # without taking the clipboard lock that paste() needs
+        self._gsn = self._try_import_gsn()
+        self._last_seq = -1
+        # Recently prompted URLs (url -> monotonic time); copying the same
+        # URL again shortly after cancelling doesn't re-open the dialog
+        self._recent = OrderedDict()
+
+    @property
+    def monitoring(self):
+        """Whether clipboard changes are currently being acted on"""
+        return self._active.is_set()
+
     def is_valid_url(self, text):
         """Check if the text contains a valid URL"""
         if not text:
             return False
-            
-        # Check if it matches URL pattern
-        if self.url_pattern.search(text):
-            try:
-                # Verify it's a proper URL with urlparse
-                parsed = urlparse(text)
-                return all([parsed.scheme, parsed.netloc])
-            except:
-                return False
-        return False
+
+        # Copied URLs often carry leading whitespace (the baseline's
+        # urlparse tolerated it); measure it on a bounded window so a
+        # multi-megabyte payload never gets stripped wholesale
+        window = text[:_MAX_URL_SCAN]
+        stripped = window.lstrip()
+        offset = len(window) - len(stripped)
+
+        # Cheap O(1) rejection before touching the regex: anything we care
+        # about starts with the scheme, so most clipboard content (including
+        # huge text blobs) is dismissed without a scan
+        if not stripped[:8].lower().startswith(_SCHEMES):
+            return False
+
+        # Bound the scanned window so a multi-megabyte payload can't make
+        # the regex expensive; real URLs fit comfortably in 4 KiB
+        match = _URL_RE.match(text, offset, min(len(text), offset + _MAX_URL_SCAN))
+        if match is None:
+            return False
+
+        # The pattern already guarantees scheme and a host-shaped token;
+        # a non-empty host is enough. Dotless hosts stay accepted —
+        # http://localhost:8000/... and bare intranet names are real
+        # download sources the baseline urlparse check allowed
+        parsed = self._fast_scheme_host(match.group(0))
+        return parsed is not None
         
+    def attach_root(self, root):
+        """
+        Reuse an existing Tk root for download prompts
+
+        Tkinter widgets must be driven from the thread that created the
+        interpreter, and building a fresh Tk() per prompt pays the full
+        Tcl startup cost each time. With a root attached, worker threads
+        enqueue prompt requests and the root drains them via after().
+        """
+        self._root = root
+        root.after(50, self._drain_prompts)
+
+    def _drain_prompts(self):
+        """Build queued prompt dialogs on the Tk main thread"""
+        try:
+            while True:
+                request = self._prompt_queue.get_nowait()
+                try:
+                    request["result"] = self._build_prompt_ui(self._root, request["url"])
+                except Exception as e:
+                    logger.error(f"Error showing download prompt: {e}")
+                finally:
+                    request["done"].set()
+        except queue.Empty:
+            pass
+        if self._running:
+            self._root.after(50, self._drain_prompts)
+
     def show_download_prompt(self, url):
         """Show a dialog asking if user wants to download the URL"""
+        if self._root is not None:
+            # Hand the UI work to the main thread and wait for the answer
+            request = {"url": url, "result": (False, None, None, None),
+                       "done": threading.Event()}
+            self._prompt_queue.put(request)
+            request["done"].wait()
+            return request["result"]
+
+        # No GUI root attached (CLI mode): fall back to a one-shot hidden root
+        import tkinter as tk
+
         try:
             root = tk.Tk()
             root.withdraw()  # Hide the main window
-            
+
             # Set window position to center of screen
             root.attributes('-topmost', True)
-            
+            try:
+                return self._build_prompt_ui(root, url)
+            finally:
+                root.destroy()
+        except Exception as e:
+            logger.error(f"Error showing download prompt: {e}")
+            return False, None, None, None
+
+    def _build_prompt_ui(self, root, url):
+        """Build the prompt Toplevel on the thread that owns the root"""
+        import tkinter as tk
+
+        try:
             download_frame = tk.Toplevel(root)
             download_frame.title("Download link detected")
             download_frame.geometry("500x200")  # Make the window taller for the new field
@@ -71,25 +206,15 @@ class ClipboardMonitor:
             url_var = tk.StringVar(value=url)
             url_entry = tk.Entry(download_frame, textvariable=url_var, width=50)
             url_entry.grid(row=0, column=1, padx=10, pady=10, sticky='we')
-            url_entry.insert(0, url)  # Explicitly set text to ensure it's visible
-            
-            # Try to get a default filename from the URL
-            default_filename = ""
-            try:
-                from urllib.parse import urlparse
-                parsed_url = urlparse(url)
-                path_parts = parsed_url.path.split('/')
-                if path_parts and path_parts[-1]:
-                    default_filename = path_parts[-1]
-            except:
-                pass
             
+            # Suggested filename from the last path segment of the URL
+            default_filename = self._default_filename(url)
+
             # Filename entry
             tk.Label(download_frame, text="Save As").grid(row=1, column=0, padx=10, pady=10, sticky='w')
             filename_var = tk.StringVar(value=default_filename)
             filename_entry = tk.Entry(download_frame, textvariable=filename_var, width=50)
             filename_entry.grid(row=1, column=1, padx=10, pady=10, sticky='we')
-            filename_entry.insert(0, default_filename)  # Explicitly set text
             
             # Authentication frame
             auth_frame = tk.LabelFrame(download_frame, text="Use authorization")
@@ -108,26 +233,22 @@ class ClipboardMonitor:
             button_frame = tk.Frame(download_frame)
             button_frame.grid(row=3, column=0, columnspan=2, padx=10, pady=10, sticky='e')
             
-            result = {"ok": False, "url": url, "filename": default_filename, "login": "", "password": ""}  # Use dict to store result
-            
+            result = PromptResult(False, url, default_filename, "", "")
+
             def on_ok():
+                nonlocal result
                 try:
                     # Capture values before destroying widgets
-                    result["ok"] = True
-                    result["url"] = url_var.get()
-                    result["filename"] = filename_var.get()
-                    result["login"] = login_entry.get()
-                    result["password"] = password_entry.get()
+                    result = PromptResult(True, url_var.get(), filename_var.get(),
+                                          login_entry.get(), password_entry.get())
                 except Exception as e:
                     logger.error(f"Error capturing entry values: {e}")
                 finally:
-                    # Always destroy windows
+                    # Only the Toplevel goes away; the root is reused
                     download_frame.destroy()
-                    root.destroy()
-                
+
             def on_cancel():
                 download_frame.destroy()
-                root.destroy()
             
             # OK and Cancel buttons
             ok_button = tk.Button(button_frame, text="OK", width=10, command=on_ok)
@@ -147,62 +268,231 @@ class ClipboardMonitor:
             # Wait for user response
             root.wait_window(download_frame)
             
-            if result["ok"]:
+            if result.ok:
                 # User clicked OK
                 credentials = None
-                
-                if result["login"] and result["password"]:
-                    credentials = (result["login"], result["password"])
-                    
-                filename = result["filename"] if result["filename"] else None
-                
-                return True, result["url"], credentials, filename
-            
+
+                if result.login and result.password:
+                    credentials = (result.login, result.password)
+
+                filename = result.filename if result.filename else None
+
+                return True, result.url, credentials, filename
+
             return False, None, None, None
             
         except Exception as e:
             logger.error(f"Error showing download prompt: {e}")
             return False, None, None, None
         
+    @staticmethod
+    def _fast_scheme_host(text):
+        """
+        Extract (scheme, host) with find/slicing only
+
+        urlparse builds a named tuple and parses query, params and fragment
+        we never look at; this covers the monitor hot path at a fraction of
+        the cost. Returns None when the scheme or host is missing or the
+        host contains whitespace.
+        """
+        sep = text.find('://')
+        if sep == -1:
+            return None
+        path_start = text.find('/', sep + 3)
+        host = text[sep + 3:] if path_start == -1 else text[sep + 3:path_start]
+        if not host or any(c.isspace() for c in host):
+            return None
+        return text[:sep], host
+
+    @staticmethod
+    def _try_import_pb():
+        """Return the macOS general pasteboard, or None off-platform/without pyobjc"""
+        if sys.platform != 'darwin':
+            return None
+        try:
+            from AppKit import NSPasteboard
+            return NSPasteboard.generalPasteboard()
+        except Exception:
+            return None
+
+    @staticmethod
+    def _try_import_gsn():
+        """Return GetClipboardSequenceNumber on Windows, or None elsewhere"""
+        if sys.platform != 'win32':
+            return None
+        try:
+            import ctypes
+            fn = ctypes.windll.user32.GetClipboardSequenceNumber
+            fn.restype = ctypes.c_uint
+            return fn
+        except Exception:
+            return None
+
+    @staticmethod
+    def _default_filename(url):
+        """Best-effort filename from the last URL path segment (no full parse)"""
+        _, sep, rest = url.partition('://')
+        if not sep:
+            rest = url
+        path_start = rest.find('/')
+        if path_start == -1:
+            return ""
+        tail = rest[path_start:].rsplit('/', 1)[-1]
+        return tail.split('?', 1)[0].split('#', 1)[0]
+
+    @staticmethod
+    def _fingerprint(text):
+        """64-bit fingerprint used for cheap change detection"""
+        if xxhash is not None:
+            return xxhash.xxh64_intdigest(text)
+        return hash(text)
+
+    def _handle_clipboard_change(self, clipboard_content):
+        """Queue the clipboard content for the consumer if it's a new URL"""
+        content_hash = self._fingerprint(clipboard_content)
+        if content_hash == self._last_hash:
+            return
+        self._last_hash = content_hash
+        if self.is_valid_url(clipboard_content):
+            logger.info(f"URL detected in clipboard: {clipboard_content}")
+            self.last_clipboard_content = clipboard_content
+            self._url_queue.put(clipboard_content)
+
     def _monitor_clipboard(self):
-        """Background thread to monitor clipboard"""
-        while self.monitoring:
+        """Clipboard watcher that polls while monitoring is active (fallback backend)"""
+        import pyperclip
+
+        active_interval = config.get("active_interval", 0.25)
+        idle_interval = config.get("idle_interval", 2.0)
+        idle_after = config.get("idle_after_s", 30)
+
+        last_change = time.monotonic()
+        previous = None
+        sleep_dt = active_interval
+        while self._running and self._active.is_set():
             try:
-                # Get current clipboard content
-                clipboard_content = pyperclip.paste()
-                
-                # Check if content changed and is a URL
-                if (clipboard_content != self.last_clipboard_content and 
-                        self.is_valid_url(clipboard_content)):
-                    
-                    logger.info(f"URL detected in clipboard: {clipboard_content}")
-                    
-                    # Store original URL before showing prompt to prevent race conditions
-                    detected_url = clipboard_content
-                    self.last_clipboard_content = clipboard_content
-                    
-                    # Run the download prompt in the main thread
-                    try:
-                        download, url, credentials, filename = self.show_download_prompt(detected_url)
-                        
-                        if download and self.downloader:
-                            # Start download in a separate thread to avoid blocking
-                            thread = threading.Thread(
-                                target=self._start_download, 
-                                args=(url, credentials, filename)
-                            )
-                            thread.daemon = True
-                            thread.start()
-                    except Exception as e:
-                        logger.error(f"Error handling download prompt: {e}")
-                        
+                changed = True
+                if self._pb is not None:
+                    # Only pay for paste() when the pasteboard generation bumped
+                    change_count = self._pb.changeCount()
+                    changed = change_count != self._last_change_count
+                    self._last_change_count = change_count
+                elif self._gsn is not None:
+                    # Lock-free probe: paste() opens the clipboard, an exclusive
+                    # resource other apps contend for; skip it when unchanged
+                    seq = self._gsn()
+                    changed = seq != self._last_seq
+                    self._last_seq = seq
+                if changed:
+                    content = pyperclip.paste()
+                    if content != previous:
+                        previous = content
+                        last_change = time.monotonic()
+                        self._handle_clipboard_change(content)
             except Exception as e:
                 logger.error(f"Error monitoring clipboard: {e}")
                 # Short pause to prevent CPU spinning when there's an error
-                time.sleep(1)
-            
-            # Short sleep to avoid high CPU usage
-            time.sleep(0.5)
+                if self._wake.wait(1):
+                    self._wake.clear()
+
+            # Poll quickly while the clipboard is in use, then back off
+            # exponentially towards the idle interval to cut wakeups
+            if time.monotonic() - last_change < idle_after:
+                sleep_dt = active_interval
+            else:
+                sleep_dt = min(sleep_dt * 2, idle_interval)
+            # Cancellable wait: stop_monitoring sets _wake for instant exit
+            if self._wake.wait(sleep_dt):
+                self._wake.clear()
+
+    def _monitor_clipboard_windows(self):
+        """Edge-triggered clipboard watcher using WM_CLIPBOARDUPDATE (Windows only)"""
+        import pyperclip
+        import ctypes
+        from ctypes import wintypes
+
+        user32 = ctypes.windll.user32
+        WM_CLIPBOARDUPDATE = 0x031D
+
+        hwnd = user32.CreateWindowExW(0, "STATIC", "pydownloader-clipboard", 0,
+                                      0, 0, 0, 0, None, None, None, None)
+        if not hwnd or not user32.AddClipboardFormatListener(hwnd):
+            raise OSError("Could not register clipboard format listener")
+
+        self._listener_hwnd = hwnd
+        try:
+            msg = wintypes.MSG()
+            while self._running and self._active.is_set():
+                # Blocks until the next message; stop_monitoring posts a
+                # wake-up message so shutdown stays immediate
+                if user32.GetMessageW(ctypes.byref(msg), hwnd, 0, 0) <= 0:
+                    break
+                if msg.message == WM_CLIPBOARDUPDATE:
+                    try:
+                        self._handle_clipboard_change(pyperclip.paste())
+                    except Exception as e:
+                        logger.error(f"Error reading clipboard: {e}")
+        finally:
+            self._listener_hwnd = None
+            user32.RemoveClipboardFormatListener(hwnd)
+            user32.DestroyWindow(hwnd)
+
+    def _monitor_clipboard_macos(self):
+        """Clipboard watcher driven by NSPasteboard.changeCount (macOS only)"""
+        import pyperclip
+        from AppKit import NSPasteboard  # provided by pyobjc
+
+        pasteboard = NSPasteboard.generalPasteboard()
+        last_count = pasteboard.changeCount()
+        while self._running and self._active.is_set():
+            # changeCount is a cheap integer read, so a short interval keeps
+            # latency low without ever deserializing unchanged content
+            count = pasteboard.changeCount()
+            if count != last_count:
+                last_count = count
+                try:
+                    self._handle_clipboard_change(pyperclip.paste())
+                except Exception as e:
+                    logger.error(f"Error reading clipboard: {e}")
+            if self._wake.wait(0.05):
+                self._wake.clear()
+
+    def _recently_prompted(self, url):
+        """Record and check a URL against the recent-prompt LRU window"""
+        now = time.monotonic()
+        # Drop expired entries from the old end; insertion order is age order
+        while self._recent:
+            oldest_url, stamp = next(iter(self._recent.items()))
+            if now - stamp < _PROMPT_SUPPRESS_S:
+                break
+            self._recent.popitem(last=False)
+
+        if url in self._recent:
+            return True
+        self._recent[url] = now
+        if len(self._recent) > _RECENT_URLS_MAX:
+            self._recent.popitem(last=False)
+        return False
+
+    def _consume_urls(self):
+        """Background thread that prompts for and dispatches queued URLs"""
+        while self._running:
+            try:
+                detected_url = self._url_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+            if self._recently_prompted(detected_url):
+                continue
+
+            try:
+                download, url, credentials, filename = self.show_download_prompt(detected_url)
+
+                if download and self.downloader:
+                    # Hand off to the bounded pool so prompting stays responsive
+                    self._pool.submit(self._start_download, url, credentials, filename)
+            except Exception as e:
+                logger.error(f"Error handling download prompt: {e}")
     
     def _start_download(self, url, credentials=None, filename=None):
         """Start a download with the downloader"""
@@ -213,9 +503,11 @@ class ClipboardMonitor:
                 logger.info(f"Download with auth: {url} (auth: {credentials[0]})")
             
             logger.info(f"Starting download: {url}")
-            
+
             # If filename is provided, create full path in the default download directory
             output_path = None
+            if not filename:
+                filename = self._default_filename(url) or None
             if filename:
                 from config import store_pth
                 import os
@@ -227,21 +519,62 @@ class ClipboardMonitor:
             logger.error(f"Error starting download: {e}")
     
     def start_monitoring(self):
-        """Start monitoring the clipboard"""
+        """Start (or resume) acting on clipboard changes"""
+        import pyperclip
+
         if not self.monitoring:
             logger.info("Starting clipboard monitoring")
-            self.monitoring = True
             self.last_clipboard_content = pyperclip.paste()  # Initialize with current clipboard
-            
-            self.monitor_thread = threading.Thread(target=self._monitor_clipboard)
-            self.monitor_thread.daemon = True
-            self.monitor_thread.start()
-    
+            self._last_hash = self._fingerprint(self.last_clipboard_content)
+            self._active.set()
+
+            if self.monitor_thread is None:
+                self.monitor_thread = threading.Thread(target=self._run_watcher)
+                self.monitor_thread.daemon = True
+                self.monitor_thread.start()
+
+                self.consumer_thread = threading.Thread(target=self._consume_urls)
+                self.consumer_thread.daemon = True
+                self.consumer_thread.start()
+
+    def _run_watcher(self):
+        """Persistent watcher thread: waits for activation, then runs the platform watcher"""
+        # Prefer the change-notification backend for the platform; polling
+        # pyperclip.paste() every tick is the last resort
+        watcher = self._monitor_clipboard
+        if sys.platform == 'win32':
+            watcher = self._monitor_clipboard_windows
+        elif sys.platform == 'darwin':
+            watcher = self._monitor_clipboard_macos
+
+        while self._running:
+            if not self._active.wait(timeout=0.5):
+                continue
+            try:
+                watcher()
+            except Exception as e:
+                if watcher is not self._monitor_clipboard and self._running:
+                    logger.warning(f"Clipboard listener unavailable ({e}), falling back to polling")
+                    watcher = self._monitor_clipboard
+
     def stop_monitoring(self):
-        """Stop monitoring the clipboard"""
+        """Pause acting on clipboard changes (threads stay alive for a cheap restart)"""
         if self.monitoring:
             logger.info("Stopping clipboard monitoring")
-            self.monitoring = False
-            if self.monitor_thread:
-                self.monitor_thread.join(timeout=1.0)
-                self.monitor_thread = None 
\ No newline at end of file
+            self._active.clear()
+            self._wake.set()
+
+            # Wake the Windows message loop so it notices the cleared flag
+            if self._listener_hwnd is not None:
+                try:
+                    import ctypes
+                    ctypes.windll.user32.PostMessageW(self._listener_hwnd, 0, 0, 0)
+                except Exception:
+                    pass
+
+    def shutdown(self):
+        """Tear the monitor down for good (unlike stop_monitoring, not resumable)"""
+        self.stop_monitoring()
+        self._running = False
+        self._wake.set()
+        self._pool.shutdown(wait=False, cancel_futures=True)
\ No newline at end of file
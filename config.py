@@ -1,44 +1,79 @@
-from os.path import expanduser
 from pathlib import Path
+import functools
 import json
 import os
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Resolve the home directory once; expanduser touches the password
+# database on Linux so there is no reason to do it repeatedly
+_HOME = Path.home()
+
 # Default configuration
 DEFAULT_CONFIG = {
     "user_agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:139.0) Gecko/20100101 Firefox/139.0",
     "segments_amount": 64,
-    "download_path": str(Path(expanduser("~")) / "downloads"),
+    "download_path": str(_HOME / "downloads"),
     "retry_times": 32,
     "chunk_size": 8192,  # 8KB chunks for better memory efficiency
     "timeout": 3600,
     "progress_bar": True,
+    "adaptive_ranges": False,  # Size segments by chunk instead of fixed count
+    "max_concurrent_files": 3,  # Whole-file download slots; use 1 on slow networks
+    "max_parallel": 16,  # In-flight segment requests per download
+    "skip_head": False,  # Probe size with a Range GET only (for CDNs with unreliable HEAD)
+    "use_io_uring": False,  # Linux only, needs the liburing bindings
+    "max_concurrent_downloads": 4,  # Worker threads for clipboard-triggered downloads
+    "active_interval": 0.25,  # Clipboard poll interval right after activity
+    "idle_interval": 2.0,  # Clipboard poll interval once idle
+    "idle_after_s": 30,  # Seconds without clipboard changes before idling
 }
 
 # Create config directory if it doesn't exist
-CONFIG_DIR = Path(expanduser("~")) / ".pydownloader"
+CONFIG_DIR = _HOME / ".pydownloader"
 CONFIG_FILE = CONFIG_DIR / "config.json"
 
+def _atomic_write_json(path, data):
+    """Write JSON via a temp file + rename so a crash never leaves a torn file"""
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp, 'wb') as f:
+        if orjson is not None:
+            f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+        else:
+            f.write(json.dumps(data, indent=4).encode())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+@functools.lru_cache(maxsize=1)
 def load_config():
-    """Load configuration from file or create with defaults"""
+    """Load configuration from file or create with defaults (cached per process)"""
     if not CONFIG_DIR.exists():
         CONFIG_DIR.mkdir(parents=True, exist_ok=True)
-    
+
     if not CONFIG_FILE.exists():
-        with open(CONFIG_FILE, 'w') as f:
-            json.dump(DEFAULT_CONFIG, f, indent=4)
-        return DEFAULT_CONFIG
-    
-    try:
-        with open(CONFIG_FILE, 'r') as f:
-            config = json.load(f)
-            # Update with any missing defaults
-            for key, value in DEFAULT_CONFIG.items():
-                if key not in config:
-                    config[key] = value
-        return config
-    except Exception as e:
-        print(f"Error loading config: {e}. Using defaults.")
-        return DEFAULT_CONFIG
+        _atomic_write_json(CONFIG_FILE, DEFAULT_CONFIG)
+        merged = DEFAULT_CONFIG
+    else:
+        try:
+            with open(CONFIG_FILE, 'rb') as f:
+                raw = f.read()
+            loaded = orjson.loads(raw) if orjson is not None else json.loads(raw)
+            # One dict merge fills in any missing defaults
+            merged = {**DEFAULT_CONFIG, **loaded}
+        except Exception as e:
+            print(f"Error loading config: {e}. Using defaults.")
+            merged = DEFAULT_CONFIG
+
+    # Ensure the download directory exists; the is_dir probe is cheaper
+    # than unconditionally walking the create-if-absent path
+    download_dir = Path(merged["download_path"])
+    if not download_dir.is_dir():
+        download_dir.mkdir(parents=True, exist_ok=True)
+    return merged
 
 # Load configuration
 config = load_config()
@@ -48,6 +83,3 @@ user_agent = config["user_agent"]
 segments_amount = config["segments_amount"]
 store_pth = config["download_path"]
 trytimes_when_failed = config["retry_times"]
-
-# Ensure download directory exists
-os.makedirs(store_pth, exist_ok=True)
@@ -1,7 +1,9 @@
 import aiohttp
 import asyncio
 import logging
+from email.message import Message
 from typing import Optional
+from urllib.parse import unquote, urlparse
 from config import config
 
 class FileInfoError(Exception):
@@ -15,52 +17,140 @@ class FileInfoManager:
         self.logger = logging.getLogger(__name__)
         self.timeout = aiohttp.ClientTimeout(total=config["timeout"])
     
-    async def get_file_info_async(self, uri: str, user_agent: str) -> dict:
+    async def get_file_info_async(self, uri: str, user_agent: str,
+                                  session: Optional[aiohttp.ClientSession] = None,
+                                  size_hint: Optional[int] = None,
+                                  etag_hint: Optional[str] = None) -> dict:
         """
         Get file information asynchronously
-        
+
         Args:
             uri: URL of the file
             user_agent: User agent to use for the request
-            
+            session: Optional shared HTTP session; when omitted a one-shot
+                session is created for this request
+            size_hint: Known file size from a previous probe (e.g. a resume
+                state file); used together with etag_hint to skip the HEAD
+            etag_hint: ETag from the previous probe; the hint is only trusted
+                after a conditional request confirms the resource is unchanged
+
         Returns:
             Dictionary with file information including size, filename, content_type
-            
+
         Raises:
             FileInfoError: If file info cannot be obtained
         """
         self.logger.info(f"Getting file info for {uri}")
         headers = {"User-Agent": user_agent}
-        
+
         try:
-            async with aiohttp.ClientSession(timeout=self.timeout) as session:
-                async with session.head(url=uri, headers=headers, allow_redirects=True) as response:
-                    if response.status >= 400:
-                        raise FileInfoError(f"Error fetching file info: HTTP {response.status}")
-                    
-                    # Get file size using different header methods
-                    file_size = self._extract_file_size(response.headers)
-                    if file_size is None:
-                        # If HEAD doesn't work, try a range request
-                        async with session.get(url=uri, headers={**headers, "Range": "bytes=0-1"}, 
-                                              allow_redirects=True) as range_response:
-                            file_size = self._extract_file_size(range_response.headers)
-                    
-                    # Get filename from Content-Disposition or URL
-                    filename = self._extract_filename(uri, response.headers)
-                    
-                    return {
-                        "size": file_size,
-                        "filename": filename,
-                        "content_type": response.headers.get("Content-Type", "application/octet-stream"),
-                        "supports_range": "Accept-Ranges" in response.headers or "Content-Range" in response.headers
-                    }
+            if session is not None:
+                # Reuse the caller's pooled connections (and their TLS/DNS state)
+                if size_hint is not None and etag_hint:
+                    cached = await self._info_from_hint(session, uri, headers, size_hint, etag_hint)
+                    if cached is not None:
+                        return cached
+                return await self._fetch_info(session, uri, headers)
+            async with aiohttp.ClientSession(timeout=self.timeout) as own_session:
+                if size_hint is not None and etag_hint:
+                    cached = await self._info_from_hint(own_session, uri, headers, size_hint, etag_hint)
+                    if cached is not None:
+                        return cached
+                return await self._fetch_info(own_session, uri, headers)
+        except FileInfoError:
+            raise
         except asyncio.TimeoutError:
             raise FileInfoError(f"Timeout while fetching file info from {uri}")
         except aiohttp.ClientError as e:
             raise FileInfoError(f"Network error: {str(e)}")
         except Exception as e:
             raise FileInfoError(f"Unexpected error: {str(e)}")
+
+    async def _info_from_hint(self, session: aiohttp.ClientSession, uri: str, headers: dict,
+                              size_hint: int, etag_hint: str) -> Optional[dict]:
+        """
+        Validate a cached size/etag with one conditional byte request
+
+        Issues a single GET for the first byte with If-Range: if the server
+        answers 206 the resource is unchanged and the hint is authoritative,
+        saving the usual HEAD round trip. Returns None when the resource
+        changed (or the check failed) so the caller does a full probe.
+        """
+        try:
+            check_headers = {**headers, "Range": "bytes=0-0", "If-Range": etag_hint}
+            async with session.get(url=uri, headers=check_headers, allow_redirects=True) as response:
+                if response.status == 206:
+                    self.logger.debug("Resource unchanged (ETag match), reusing cached file info")
+                    return {
+                        "size": size_hint,
+                        "filename": self._extract_filename(uri, response.headers),
+                        "content_type": response.headers.get("Content-Type", "application/octet-stream"),
+                        "supports_range": True,
+                        "etag": etag_hint
+                    }
+        except aiohttp.ClientError as e:
+            self.logger.debug(f"Conditional probe failed, falling back to HEAD: {e}")
+        return None
+
+    async def _fetch_info(self, session: aiohttp.ClientSession, uri: str, headers: dict) -> dict:
+        """Probe the server for size and metadata
+
+        The HEAD and a one-byte Range GET used to run serially (HEAD first,
+        GET only if it lacked a size) — two round trips on the cold path.
+        They are now issued concurrently and whichever succeeds first
+        supplies the answer; with config["skip_head"] only the Range GET is
+        sent, for hosts whose HEAD responses are known to be unreliable.
+        """
+        async def head_probe():
+            async with session.head(url=uri, headers=headers, allow_redirects=True) as response:
+                if response.status >= 400:
+                    raise FileInfoError(f"Error fetching file info: HTTP {response.status}")
+                # Headers stay valid after the response is released
+                return response.headers
+
+        async def range_probe():
+            range_headers = {**headers, "Range": "bytes=0-1"}
+            async with session.get(url=uri, headers=range_headers, allow_redirects=True) as response:
+                if response.status >= 400:
+                    raise FileInfoError(f"Error fetching file info: HTTP {response.status}")
+                return response.headers
+
+        if config.get("skip_head"):
+            results = [await range_probe()]
+        else:
+            results = await asyncio.gather(head_probe(), range_probe(), return_exceptions=True)
+
+        file_size = None
+        supports_range = False
+        chosen = None
+        for result in results:
+            if isinstance(result, BaseException):
+                continue
+            if chosen is None:
+                chosen = result
+            # Check the header value, not mere presence: servers that reject
+            # ranges advertise "Accept-Ranges: none". A Content-Range answer
+            # to the range probe (a 206) is the strongest positive signal
+            if ("Content-Range" in result
+                    or result.get("Accept-Ranges", "").lower() == "bytes"):
+                supports_range = True
+            if file_size is None:
+                file_size = self._extract_file_size(result)
+
+        if chosen is None:
+            # Every probe failed; surface the first failure
+            for result in results:
+                if isinstance(result, BaseException):
+                    raise result
+            raise FileInfoError(f"Error fetching file info from {uri}")
+
+        return {
+            "size": file_size,
+            "filename": self._extract_filename(uri, chosen),
+            "content_type": chosen.get("Content-Type", "application/octet-stream"),
+            "supports_range": supports_range,
+            "etag": chosen.get("ETag")
+        }
     
     def get_file_size(self, uri: str, user_agent: str) -> int:
         """
@@ -104,26 +194,25 @@ class FileInfoManager:
     
     def _extract_filename(self, uri: str, headers: dict) -> str:
         """Extract filename from Content-Disposition header or URL"""
-        # Try Content-Disposition header
+        # Try Content-Disposition header; email.message understands both
+        # the plain filename= form and RFC 5987's filename*=UTF-8''...,
+        # including percent-escape decoding
         if "Content-Disposition" in headers:
-            content_disp = headers["Content-Disposition"]
-            for part in content_disp.split(";"):
-                part = part.strip()
-                if part.startswith("filename="):
-                    filename = part[9:].strip('"\'')
-                    if filename:
-                        return filename
-        
-        # Fallback to URL
+            msg = Message()
+            msg['content-disposition'] = headers["Content-Disposition"]
+            filename = msg.get_filename()
+            if filename:
+                return filename
+
+        # Fallback to the (decoded) last URL path segment
         try:
-            from urllib.parse import urlparse
-            path = urlparse(uri).path
-            filename = path.split("/")[-1]
+            path = unquote(urlparse(uri).path)
+            filename = path.rsplit("/", 1)[-1]
             if filename:
                 return filename
-        except Exception:
+        except ValueError:
             pass
-        
+
         # Default filename if nothing else works
         return "downloaded_file"
 
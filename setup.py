@@ -28,7 +28,14 @@ setup(
         "click>=8.1.7",
         "aiofiles>=23.2.1",
         "pyperclip>=1.8.2",
+        "numpy>=1.26.0",
     ],
+    extras_require={
+        "speed": [
+            "orjson>=3.9.0",
+            "xxhash>=3.4.0",
+        ],
+    },
     entry_points={
         "console_scripts": [
             "pygeekdownloader=app:cli",